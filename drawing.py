@@ -1,9 +1,9 @@
-from math import cos, sin, pi
+from math import cos, sin
 from typing import Tuple
 import numpy as np
 import pyglet as pyglet
 
-from ray_casting import ray_cast
+from ray_casting import ray_cast_batch, ray_directions
 from maze import Maze
 
 
@@ -25,25 +25,115 @@ class Scene:
         self.height = height
 
         self._translation = np.zeros(2, dtype=np.float64)
-        self.rotation = 0.0
-        self.scale_factor = 1.0
-        self.flip_horizontally = False
-        self.flip_vertically = False
+        self._rotation = 0.0
+        self._scale_factor = 1.0
+        self._flip_horizontally = False
+        self._flip_vertically = False
+
+        self._matrix_dirty = True
+        self._matrix_version = 0
+        self._cached_matrix = None
+        self._rotation_dirty = True
+        self._cached_rotation_matrix = None
+        self._cos_rotation = 1.0
+        self._sin_rotation = 0.0
+        self._is_rotated = False
+        self._rotated_dirs = {}
+
+    @property
+    def matrix_version(self):
+        """A counter that is incremented whenever the camera is transformed
+
+        Callers can compare this to a stored value to find out if geometry they transformed earlier is still valid.
+        """
+        return self._matrix_version
+
+    @property
+    def is_rotated(self):
+        """Is the rotation something other than the identity?
+
+        Callers that rotate points per frame can skip the rotation maths entirely when this is False.
+        """
+        return self._is_rotated
+
+    @property
+    def rotation(self):
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, value):
+        self._rotation = value
+        self._cos_rotation = cos(value)
+        self._sin_rotation = sin(value)
+        self._is_rotated = value != 0.0
+        self._matrix_dirty = True
+        self._rotation_dirty = True
+        self._matrix_version += 1
+        self._rotated_dirs.clear()
+
+    @property
+    def scale_factor(self):
+        return self._scale_factor
+
+    @scale_factor.setter
+    def scale_factor(self, value):
+        self._scale_factor = value
+        self._matrix_dirty = True
+        self._matrix_version += 1
+
+    @property
+    def flip_horizontally(self):
+        return self._flip_horizontally
+
+    @flip_horizontally.setter
+    def flip_horizontally(self, value):
+        self._flip_horizontally = value
+        self._matrix_dirty = True
+        self._matrix_version += 1
+
+    @property
+    def flip_vertically(self):
+        return self._flip_vertically
+
+    @flip_vertically.setter
+    def flip_vertically(self, value):
+        self._flip_vertically = value
+        self._matrix_dirty = True
+        self._matrix_version += 1
 
     def camera_matrix(self):
         """
         :return: A 3x3 matrix that is used to transform coordinates before they are displayed.
+
+        The matrix is cached, and only recomputed after the camera has been transformed.
+        """
+        if self._matrix_dirty:
+            self._cached_matrix = self._compute_camera_matrix()
+            self._matrix_dirty = False
+
+        return self._cached_matrix
+
+    def camera_matrix_2x2_and_t(self):
+        """
+        :return: The linear part of the camera matrix as a (2, 2) array, and the translation as a (2,) array.
+
+        This lets primitives skip the homogeneous coordinate maths and transform points as points @ linear.T +
+        translation.
         """
+        matrix = self.camera_matrix()
+        return matrix[:2, :2], matrix[:2, 2]
+
+    def _compute_camera_matrix(self):
         result = np.identity(3, dtype=np.float64)
         result[:2, 2] = self._translation
         result = self.rotation_matrix() @ result
-        result *= self.scale_factor
+        result *= self._scale_factor
         result[:2, 2] += self.width / 2, self.height / 2
 
-        if self.flip_horizontally:
+        if self._flip_horizontally:
             result[0, 0] *= -1
             result[0, 2] = self.width - result[0, 2]
-        if self.flip_vertically:
+        if self._flip_vertically:
             result[1, 1] *= -1
             result[1, 2] = self.height - result[1, 2]
 
@@ -53,16 +143,22 @@ class Scene:
         """
         :param three_by_three: If True, a 3x3 matrix will be returned. Else, a 2x2 matrix will be returned.
         :return: A matrix that is used to rotate coordinates before they are displayed
+
+        The 2x2 matrix is cached, and only recomputed after the rotation has changed.
         """
-        result = np.array([[cos(self.rotation), sin(self.rotation)],
-                           [-sin(self.rotation), cos(self.rotation)]], dtype=np.float64)
+        if self._rotation_dirty:
+            self._cached_rotation_matrix = np.array([[self._cos_rotation, self._sin_rotation],
+                                                     [-self._sin_rotation, self._cos_rotation]], dtype=np.float64)
+            # the same 2x2 array is handed to every caller, so stop them mutating it
+            self._cached_rotation_matrix.setflags(write=False)
+            self._rotation_dirty = False
 
         if three_by_three:
-            _result = np.identity(3, dtype=np.float64)
-            _result[:2, :2] = result
-            return _result
+            result = np.identity(3, dtype=np.float64)
+            result[:2, :2] = self._cached_rotation_matrix
+            return result
 
-        return result
+        return self._cached_rotation_matrix
 
     def draw_rect(self, x: float, y: float, width: float, height: float, colour: Tuple[int, int, int, int]):
         """Draw a rectangle from the perspective of the camera.
@@ -73,15 +169,16 @@ class Scene:
         :param height:
         :param colour: red, green, blue, alpha. The values in [0, 127].
         """
-        points = np.array([[x, y, 1],
-                           [x + width, y, 1],
-                           [x + width, y + height, 1],
-                           [x, y + height, 1]], dtype=np.float64)
-        points = (self.camera_matrix() @ points.T).T
+        linear, translation = self.camera_matrix_2x2_and_t()
+        points = np.array([[x, y],
+                           [x + width, y],
+                           [x + width, y + height],
+                           [x, y + height]], dtype=np.float64)
+        points = points @ linear.T + translation
 
         pyglet.gl.glColor4b(*colour)
         pyglet.gl.glBegin(pyglet.gl.GL_QUADS)
-        for x, y, _ in points:
+        for x, y in points:
             pyglet.gl.glVertex2f(x, y)
         pyglet.gl.glEnd()
 
@@ -96,14 +193,15 @@ class Scene:
         :param colour: red, green, blue, alpha. The values in [0, 127].
         :param line_width:
         """
-        points = np.array([[x1, y1, 1],
-                           [x2, y2, 1]], dtype=np.float64)
-        points = (self.camera_matrix() @ points.T).T
+        linear, translation = self.camera_matrix_2x2_and_t()
+        points = np.array([[x1, y1],
+                           [x2, y2]], dtype=np.float64)
+        points = points @ linear.T + translation
 
         pyglet.gl.glColor4b(*colour)
         pyglet.gl.glLineWidth(line_width)
         pyglet.gl.glBegin(pyglet.gl.GL_LINES)
-        for x, y, _ in points:
+        for x, y in points:
             pyglet.gl.glVertex2f(x, y)
         pyglet.gl.glEnd()
 
@@ -115,7 +213,14 @@ class Scene:
         :param x:
         :param y:
         """
+        # the camera is repositioned every tick whether or not the player moved, so don't invalidate the cached
+        # matrix (and everything keyed on matrix_version) when the position is unchanged
+        if self._translation[0] == -x and self._translation[1] == -y:
+            return
+
         self._translation[:] = -x, -y
+        self._matrix_dirty = True
+        self._matrix_version += 1
 
     def zoom(self, zoom_factor: float):
         """Zoom the camera in
@@ -124,7 +229,9 @@ class Scene:
 
         :param zoom_factor:
         """
-        self.scale_factor *= zoom_factor
+        self._scale_factor *= zoom_factor
+        self._matrix_dirty = True
+        self._matrix_version += 1
 
     def rotate_vector(self, x: float, y: float, invert: bool = False):
         """Rotate a vector to where it would be displayed
@@ -132,32 +239,55 @@ class Scene:
         :param x:
         :param y:
         :param invert: If True, the inverse rotation will be applied
+        :return: The rotated x and y components
         """
-        rotation_matrix = self.rotation_matrix(three_by_three=False)
+        # The inverse of a rotation matrix is its transpose, so both cases are a couple of multiplications using the
+        # cached sin and cos.
+        c, s = self._cos_rotation, self._sin_rotation
         if invert:
-            rotation_matrix = np.linalg.inv(rotation_matrix)
+            return c * x - s * y, s * x + c * y
 
-        vector = np.array([x, y], dtype=np.float64).reshape(-1, 1)
-        vector = rotation_matrix @ vector
-        return vector.reshape(-1)
+        return c * x + s * y, -s * x + c * y
 
-    def transform_point(self, x, y, invert=False) -> np.ndarray:
+    def rotate_dir(self, x_direction: int, y_direction: int, invert: bool = False):
+        """Rotate a movement direction to where it would be displayed
+
+        The keyboard only produces nine distinct directions, so the rotated results are cached until the rotation
+        changes.
+
+        :param x_direction: -1, 0, or 1
+        :param y_direction: -1, 0, or 1
+        :param invert: If True, the inverse rotation will be applied
+        :return: The rotated x and y components
+        """
+        key = (x_direction, y_direction, invert)
+        result = self._rotated_dirs.get(key)
+        if result is None:
+            result = self._rotated_dirs[key] = self.rotate_vector(x_direction, y_direction, invert=invert)
+
+        return result
+
+    def transform_point(self, x, y, invert=False):
         """Transform a point to where it would be displayed
 
         :param x:
         :param y:
         :param invert: If True, the inverse transformation will be applied.
+        :return: The transformed x and y coordinates
         """
-        point = np.array([x, y, 1], dtype=np.float64).reshape(-1, 1)
+        matrix = self.camera_matrix()
 
-        camera_matrix = self.camera_matrix()
         if invert:
-            camera_matrix = np.linalg.inv(camera_matrix)
-            point[2] = self.scale_factor
+            # The camera matrix is affine, so its inverse has a closed form - no need for np.linalg.inv.
+            a, b, tx = matrix[0]
+            c, d, ty = matrix[1]
+            determinant = a * d - b * c
+            x -= tx
+            y -= ty
+            return (d * x - b * y) / determinant, (a * y - c * x) / determinant
 
-        point = camera_matrix @ point
-
-        return point[:2, 0]
+        return (matrix[0, 0] * x + matrix[0, 1] * y + matrix[0, 2],
+                matrix[1, 0] * x + matrix[1, 1] * y + matrix[1, 2])
 
 
 def draw_ray_casts(cell_size, x, y, maze, num_rays=64, line_width=1, colour=(0, 0, 0, 127)):
@@ -172,35 +302,58 @@ def draw_ray_casts(cell_size, x, y, maze, num_rays=64, line_width=1, colour=(0,
     :param colour:
     :return:
     """
+    dxs, dys = ray_directions(num_rays)
+    ends = ray_cast_batch(x, y, dxs, dys, maze)
+
     pyglet.gl.glColor4b(*colour)
     pyglet.gl.glLineWidth(line_width)
 
-    for ray_num in range(num_rays):
-        angle = 2 * pi / num_rays * ray_num
-        dx = sin(angle)
-        dy = cos(angle)
-        end_x, end_y = ray_cast(x, y, dx, dy, maze)
-
-        pyglet.gl.glBegin(pyglet.gl.GL_LINES)
+    pyglet.gl.glBegin(pyglet.gl.GL_LINES)
+    for end_x, end_y in ends:
         pyglet.gl.glVertex2f(x * cell_size, y * cell_size)
         pyglet.gl.glVertex2f(end_x * cell_size, end_y * cell_size)
-        pyglet.gl.glEnd()
+    pyglet.gl.glEnd()
+
+
+# Cached vertex lists used by draw_maze, keyed by the ids of the scene and maze. Each entry also stores the camera
+# matrix and wall segments that the vertex list was built from, so it can be rebuilt when either changes.
+_maze_vertex_lists = {}
 
 
 def draw_maze(scene: Scene, maze: Maze, colour=(0, 0, 0, 127), line_width=1):
     """Draw a maze using a given scene
 
+    All the wall endpoints are transformed in a single matrix multiplication and kept in a pyglet vertex list, which
+    is drawn with one call. The vertex list is only rebuilt when the camera or the maze changes, so drawing a static
+    maze costs almost nothing per frame.
+
     :param scene:
     :param maze:
     :param colour: red, green, blue, alpha. The values in [0, 127].
     :param line_width:
     """
+    camera_version = scene.matrix_version
+    starts, ends = maze.wall_segments()
+
+    # wall_segments() returns a cached object, so an identity check is enough to detect a regenerated maze
+    cache_key = (id(scene), id(maze))
+    cached = _maze_vertex_lists.get(cache_key)
+
+    if cached is None or cached[1] != camera_version or cached[2] is not starts:
+        # interleave the wall segment endpoints into start, end pairs, and transform them all at once
+        endpoints = np.stack([starts, ends], axis=1).reshape(-1, 2)
+        points = np.ones((len(endpoints), 3), dtype=np.float64)
+        points[:, :2] = endpoints
+        points = (scene.camera_matrix() @ points.T).T
+
+        if cached is not None:
+            cached[0].delete()
+
+        vertex_list = pyglet.graphics.vertex_list(len(points), ('v2f', points[:, :2].ravel()))
+        _maze_vertex_lists[cache_key] = (vertex_list, camera_version, starts)
+    else:
+        vertex_list = cached[0]
+
     pyglet.gl.glColor4b(*colour)
     pyglet.gl.glLineWidth(line_width)
-
-    for row in maze:
-        for cell in row:
-            if cell.bottom:
-                scene.draw_line(cell.x, cell.y + 1, cell.x + 1, cell.y + 1, colour, line_width=line_width)
-            if cell.right:
-                scene.draw_line(cell.x + 1, cell.y, cell.x + 1, cell.y + 1, colour, line_width=line_width)
+    vertex_list.draw(pyglet.gl.GL_LINES)
@@ -1,5 +1,5 @@
 from random import randint
-import numpy as np
+from typing import Tuple
 
 from maze import Maze, Cell
 
@@ -20,17 +20,25 @@ class Player:
         self.width = width
         self.height = height
 
-    def center(self) -> np.ndarray:
+    def center(self) -> Tuple[float, float]:
         """
         :return: Position of the center of the rectangle
         """
-        return np.array([self.x + self.width / 2, self.y + self.height / 2])
+        return self.x + self.width / 2, self.y + self.height / 2
 
-    def position(self) -> np.ndarray:
+    def position(self) -> Tuple[float, float]:
         """
         :return: Position of the origin of the rectangle
         """
-        return np.array([self.x, self.y])
+        return self.x, self.y
+
+    def snapshot(self) -> Tuple[float, float, float, float]:
+        """
+        :return: The origin and centre of the rectangle as (x, y, center_x, center_y), read in one call for code that
+                 needs both every frame
+        """
+        x, y = self.x, self.y
+        return x, y, x + self.width / 2, y + self.height / 2
 
     def set_velocity(self, x_velocity: float, y_velocity: float):
         self.x_velocity = x_velocity
@@ -61,7 +69,8 @@ class Game:
         """
         :return: The cell that the player is currently in.
         """
-        return self.maze.cell_at(*self.player.center().astype(np.int32))
+        center_x, center_y = self.player.center()
+        return self.maze.cell_at(int(center_x), int(center_y))
 
     def set_player_move_direction(self, x_direction: int, y_direction: int):
         """
@@ -7,6 +7,7 @@ from pyglet.window import key, mouse
 from drawing import Scene, draw_maze
 from game import Game
 from maze import Maze
+from tts import TTSThread
 import vision_tools
 
 
@@ -52,7 +53,7 @@ def run_main_game(game: Game, VisionTool: Type[vision_tools.VisionTool], window_
         # set player move direction and update game
         x_direction = int(keys[key.D]) - int(keys[key.A])
         y_direction = int(keys[key.S]) - int(keys[key.W])
-        x_direction, y_direction = scene.rotate_vector(x_direction, y_direction, invert=True)
+        x_direction, y_direction = scene.rotate_dir(x_direction, y_direction, invert=True)
         game.set_player_move_direction(x_direction, y_direction)
         game.update(dt)
 
@@ -70,7 +71,8 @@ def run_main_game(game: Game, VisionTool: Type[vision_tools.VisionTool], window_
     window.close()
 
 
-def prompt_for_final_position(game: Game, window_width: int, window_height: int, cell_size: float):
+def prompt_for_final_position(game: Game, tts_thread: TTSThread, window_width: int, window_height: int,
+                              cell_size: float):
     """Prompt the user to click on the cell of the maze that they think they are currently in
 
     A window will open with an image of the maze. The user will click on a cell. The correct cell will then be displayed
@@ -78,12 +80,13 @@ def prompt_for_final_position(game: Game, window_width: int, window_height: int,
     exits.
 
     :param game: Game containing the maze and player position to use
+    :param tts_thread: A running TTSThread used to announce the prompt without blocking this thread
     :param window_width: Width of the window in pixels
     :param window_height: Height of the window in pixels
     :param cell_size: The side length of a cell of the maze in pixels. This determines the size at which  the maze will
                       be drawn.
     """
-    pyttsx3.speak('Your time is up. Click where you think you finished')
+    tts_thread.say('Your time is up. Click where you think you finished')
 
     window = pyglet.window.Window(window_width, window_height, 'Click where you think you finished')
     pyglet.gl.glClearColor(1, 1, 1, 1)
@@ -125,12 +128,19 @@ def main():
     # I get an error when using the CombinedTool unless I add this line. It must be a bug with pyttsx3.
     pyttsx3.init()
 
+    tts_thread = TTSThread()
+    tts_thread.setDaemon(True)
+    tts_thread.start()
+
     maze = Maze(20, 20)
     maze.generate()
     game = Game(maze)
 
     run_main_game(game, vision_tools.CombinedTool, 960, 720, 100.0, 60.0)
-    prompt_for_final_position(game, 960, 720, 20.0)
+    prompt_for_final_position(game, tts_thread, 960, 720, 20.0)
+
+    tts_thread.terminate()
+    tts_thread.join(timeout=5.0)
 
 
 if __name__ == '__main__':
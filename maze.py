@@ -1,12 +1,20 @@
-from dataclasses import dataclass
 from random import shuffle
+from typing import NamedTuple
 import numpy as np
 
+# wall mask, opposite wall mask, and cell offset for each of the four walls
+_WALLS_AND_OFFSETS = ((1, 4, 0, -1), (2, 8, -1, 0), (4, 1, 0, 1), (8, 2, 1, 0))
 
-@dataclass(frozen=True)
-class Cell:
+# bitmasks for testing the wall bits of a cell, in the same order as Cell.walls: left, top, right, bottom
+WALL_MASKS = (2, 1, 8, 4)
+
+
+class Cell(NamedTuple):
     """A cell in a maze
 
+    This is a named tuple rather than a dataclass, because cells are created on every cell lookup and tuple
+    construction is much cheaper.
+
     :var x: X position in cells
     :var y: Y position in cells
     :var left: Is there a wall on the left?
@@ -36,40 +44,54 @@ class Maze:
     """
     def __init__(self, width, height):
         self.grid = np.full((height, width), 15, dtype=np.uint8)
-        self._visited = np.zeros((height, width), dtype=np.bool_)
+        # a flat view of the grid - scalar indexing into it with y * width + x is faster than 2d indexing
+        self.grid_flat = self.grid.reshape(-1)
+        self._visited = np.zeros(height * width, dtype=np.bool_)
         self.width = width
         self.height = height
+        self._wall_segments = None
+        self._walls_arrays = None
 
     def generate(self):
         self.grid[:, :] = 15
-        self._visited[:, :] = False
+        self._visited[:] = False
+        self._wall_segments = None
+        self._walls_arrays = None
         self._generate(0, 0)
 
     def _generate(self, x, y):
-        self._visited[y, x] = True
+        # An explicit stack is used instead of recursion, so that large mazes don't hit the recursion limit. Each
+        # stack entry holds a cell and the walls that haven't been tried from it yet, in a random order.
+        self._visited[y * self.width + x] = True
+        stack = [(x, y, self._shuffled_walls())]
+
+        while stack:
+            x, y, walls = stack[-1]
+            if not walls:
+                stack.pop()
+                continue
 
-        # iterate through neighbours randomly
-        wall_numbers_and_offsets = list(enumerate([(0, -1), (-1, 0), (0, 1), (1, 0)]))
-        shuffle(wall_numbers_and_offsets)
-        for w, (dx, dy) in wall_numbers_and_offsets:
+            wall_mask, opposite_wall_mask, dx, dy = walls.pop()
             i, j = x + dx, y + dy
 
             if i < 0 or i >= self.width or j < 0 or j >= self.height:
                 continue
-            if self._visited[j, i]:
+            if self._visited[j * self.width + i]:
                 continue
 
             # remove wall in this cell and the next cell
-            wall_mask = 1 << w
-            if wall_mask >= 4:
-                opposite_wall_mask = wall_mask >> 2
-            else:
-                opposite_wall_mask = wall_mask << 2
-            self.grid[y, x] = self.grid[y, x] & ~wall_mask
-            self.grid[j, i] = self.grid[j, i] & ~opposite_wall_mask
+            self.grid_flat[y * self.width + x] &= ~wall_mask
+            self.grid_flat[j * self.width + i] &= ~opposite_wall_mask
+
+            # proceed to the next cell
+            self._visited[j * self.width + i] = True
+            stack.append((i, j, self._shuffled_walls()))
 
-            # proceed to the next cell recursively
-            self._generate(i, j)
+    @staticmethod
+    def _shuffled_walls():
+        walls = list(_WALLS_AND_OFFSETS)
+        shuffle(walls)
+        return walls
 
     def cell_at(self, x: int, y: int) -> Cell:
         """Get information about the walls surrounding a cell
@@ -78,24 +100,69 @@ class Maze:
         :param y:
         :return:
         """
-        cell = self.grid[y, x]
+        cell = self.grid_flat[y * self.width + x]
         cell = Cell(x, y, bool(cell & 2), bool(cell & 8), bool(cell & 1), bool(cell & 4))
         return cell
 
+    def wall_bits(self, x: int, y: int) -> int:
+        """Get the raw wall bits of a cell
+
+        The bits can be tested with the masks in WALL_MASKS. This avoids constructing a Cell when a caller only needs
+        to test a wall or two.
+
+        :param x:
+        :param y:
+        :return: The wall bits of the cell
+        """
+        return int(self.grid_flat[y * self.width + x])
+
+    def walls_arrays(self):
+        """Get boolean arrays describing the walls of every cell
+
+        This avoids building a Cell object per cell when a caller just needs the wall bits. The result is cached,
+        since the walls don't change until generate() is called again.
+
+        :return: Four (height, width) boolean arrays: left, top, right, bottom
+        """
+        if self._walls_arrays is None:
+            self._walls_arrays = ((self.grid & 2).astype(bool), (self.grid & 1).astype(bool),
+                                  (self.grid & 8).astype(bool), (self.grid & 4).astype(bool))
+
+        return self._walls_arrays
+
+    def wall_segments(self):
+        """Get the endpoints of the bottom and right walls of every cell
+
+        Each cell only stores its bottom and right walls here, because the top and left walls are shared with the
+        neighbouring cells. The result is cached, since the walls don't change until generate() is called again.
+
+        :return: Two arrays of shape (K, 2) containing the start and end points of each wall segment
+        """
+        if self._wall_segments is None:
+            ys, xs = np.nonzero(self.grid & 4)
+            bottom_starts = np.stack([xs, ys + 1], axis=1)
+            bottom_ends = np.stack([xs + 1, ys + 1], axis=1)
+
+            ys, xs = np.nonzero(self.grid & 8)
+            right_starts = np.stack([xs + 1, ys], axis=1)
+            right_ends = np.stack([xs + 1, ys + 1], axis=1)
+
+            self._wall_segments = (np.concatenate([bottom_starts, right_starts]),
+                                   np.concatenate([bottom_ends, right_ends]))
+
+        return self._wall_segments
+
     def __iter__(self):
         return ((self.cell_at(x, y) for x in range(self.width)) for y in range(self.height))
 
 
 def maze_as_ascii(maze: Maze) -> str:
-    result = ''
-    for row in maze:
-        for cell in row:
-            result += '_' if cell.bottom else ' '
-            result += '|' if cell.right else ' '
-
-        result += '\n'
+    _, _, right, bottom = maze.walls_arrays()
 
-    return result
+    return ''.join(
+        ''.join(('_' if b else ' ') + ('|' if r else ' ') for b, r in zip(bottom_row, right_row)) + '\n'
+        for bottom_row, right_row in zip(bottom, right)
+    )
 
 
 def main():
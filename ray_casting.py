@@ -1,59 +1,111 @@
-from math import ceil, floor, pi, sin, cos
-from typing import Generator
+from functools import lru_cache
+from math import ceil, floor, isfinite, pi
+from typing import Generator, Tuple
 import numpy as np
+from numba import njit
 
 from maze import Maze
 
 
-def ray_cast(x: float, y: float, dx: float, dy: float, maze: Maze) -> np.ndarray:
-    """Cast a ray through a maze
+@lru_cache(maxsize=8)
+def ray_directions(num_rays: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the direction components of evenly-spaced rays
 
-    :param x: Starting x position of the ray
-    :param y: Starting y position of the ray
-    :param dx: Dx and dy are used to specify the direction that the ray moves.
-    :param dy:
-    :param maze: The maze that the ray moves through
-    :return: The position of the ray the first time it hits a wall
+    The result is cached by num_rays, so the sines and cosines are only computed once.
+
+    :param num_rays: Number of rays
+    :return: Two arrays containing the x and y components of the ray directions
     """
+    angles = np.arange(num_rays) * (2 * pi / num_rays)
+    return np.sin(angles), np.cos(angles)
+
+
+@njit(cache=True)
+def _ray_cast(x: float, y: float, dx: float, dy: float, grid_flat: np.ndarray, width: int,
+              height: int) -> Tuple[float, float]:
+    # This is the hot loop of the ray cast, so it is compiled with numba, and it only uses scalar maths. The wall bits
+    # are read straight out of the flat grid instead of going through Maze.cell_at().
     x_sign = 1 if dx > 0 else -1
     y_sign = 1 if dy > 0 else -1
-    signs = np.array([x_sign, y_sign])
 
     x_inc = dx / abs(dy) if dy != 0 else float('inf')
     y_inc = dy / abs(dx) if dx != 0 else float('inf')
 
     if y_sign > 0:
-        next_h_intersection = np.array([x + x_inc * (1 - y % 1), ceil(y)])
+        next_h_x, next_h_y = x + x_inc * (1 - y % 1), float(ceil(y))
     else:
-        next_h_intersection = np.array([x + x_inc * (y % 1), floor(y)])
+        next_h_x, next_h_y = x + x_inc * (y % 1), float(floor(y))
     if x_sign > 0:
-        next_v_intersection = np.array([ceil(x), y + y_inc * (1 - x % 1)])
+        next_v_x, next_v_y = float(ceil(x)), y + y_inc * (1 - x % 1)
     else:
-        next_v_intersection = np.array([floor(x), y + y_inc * (x % 1)])
+        next_v_x, next_v_y = float(floor(x)), y + y_inc * (x % 1)
 
-    if not np.all(np.isfinite(next_h_intersection)):
-        next_h_intersection[:] = x_sign * np.inf, y_sign * np.inf
-    if not np.all(np.isfinite(next_v_intersection)):
-        next_v_intersection[:] = x_sign * np.inf, y_sign * np.inf
+    if not (isfinite(next_h_x) and isfinite(next_h_y)):
+        next_h_x, next_h_y = x_sign * np.inf, y_sign * np.inf
+    if not (isfinite(next_v_x) and isfinite(next_v_y)):
+        next_v_x, next_v_y = x_sign * np.inf, y_sign * np.inf
 
     while True:
-        if np.all(signs * next_h_intersection <= signs * next_v_intersection):
-            intersection = next_h_intersection
-            if intersection[0] >= maze.width or intersection[1] >= maze.width:
-                return intersection
+        if x_sign * next_h_x <= x_sign * next_v_x and y_sign * next_h_y <= y_sign * next_v_y:
+            intersection_x, intersection_y = next_h_x, next_h_y
+            if intersection_x < 0 or intersection_x >= width or intersection_y < 0 or intersection_y >= height:
+                return intersection_x, intersection_y
 
-            wall = maze.cell_at(floor(intersection[0]), round(intersection[1])).top
-            next_h_intersection = intersection[0] + x_inc, intersection[1] + y_sign
+            wall = grid_flat[int(round(intersection_y)) * width + int(floor(intersection_x))] & 1
+            next_h_x, next_h_y = intersection_x + x_inc, intersection_y + y_sign
         else:
-            intersection = next_v_intersection
-            if intersection[0] >= maze.width or intersection[1] >= maze.width:
-                return intersection
+            intersection_x, intersection_y = next_v_x, next_v_y
+            if intersection_x < 0 or intersection_x >= width or intersection_y < 0 or intersection_y >= height:
+                return intersection_x, intersection_y
 
-            wall = maze.cell_at(round(intersection[0]), floor(intersection[1])).left
-            next_v_intersection = intersection[0] + x_sign, intersection[1] + y_inc
+            wall = grid_flat[int(floor(intersection_y)) * width + int(round(intersection_x))] & 2
+            next_v_x, next_v_y = intersection_x + x_sign, intersection_y + y_inc
 
         if wall:
-            return intersection
+            return intersection_x, intersection_y
+
+
+def ray_cast(x: float, y: float, dx: float, dy: float, maze: Maze) -> np.ndarray:
+    """Cast a ray through a maze
+
+    :param x: Starting x position of the ray
+    :param y: Starting y position of the ray
+    :param dx: Dx and dy are used to specify the direction that the ray moves.
+    :param dy:
+    :param maze: The maze that the ray moves through
+    :return: The position of the ray the first time it hits a wall
+    """
+    return np.array(_ray_cast(x, y, dx, dy, maze.grid_flat, maze.width, maze.height))
+
+
+@njit(cache=True)
+def _ray_cast_batch(x, y, dxs, dys, grid_flat, width, height, out):
+    for ray_num in range(len(dxs)):
+        out[ray_num, 0], out[ray_num, 1] = _ray_cast(x, y, dxs[ray_num], dys[ray_num], grid_flat, width, height)
+
+
+def ray_cast_batch(x: float, y: float, dxs: np.ndarray, dys: np.ndarray, maze: Maze,
+                   out: np.ndarray = None) -> np.ndarray:
+    """Cast multiple rays from a point through a maze in one compiled pass
+
+    :param x: Start x position of the rays
+    :param y: Start y position of the rays
+    :param dxs: Dxs and dys are arrays specifying the direction of each ray.
+    :param dys:
+    :param maze: Maze that the rays move through
+    :param out: If specified, the results are written into this (N, 2) array instead of allocating a new one.
+    :return: An (N, 2) array containing the position of each ray when it first hits a wall
+    """
+    if out is None:
+        out = np.empty((len(dxs), 2), dtype=np.float64)
+
+    _ray_cast_batch(x, y, dxs, dys, maze.grid_flat, maze.width, maze.height, out)
+    return out
+
+
+# Cast a throwaway ray through a one-cell maze at import time. This triggers the numba compilation (or the load of the
+# cached binary), so the first frame of the game doesn't stall on it.
+_ray_cast_batch(0.5, 0.5, *ray_directions(1), np.full(1, 15, dtype=np.uint8), 1, 1, np.empty((1, 2)))
 
 
 def ray_casts(x, y, maze, num_rays=64) -> Generator[np.ndarray, None, None]:
@@ -65,8 +117,5 @@ def ray_casts(x, y, maze, num_rays=64) -> Generator[np.ndarray, None, None]:
     :param num_rays: Number of rays to cast
     :return: Yields the position of each ray when it first hits a wall
     """
-    for ray_num in range(num_rays):
-        angle = 2 * pi / num_rays * ray_num
-        dx = sin(angle)
-        dy = cos(angle)
-        yield ray_cast(x, y, dx, dy, maze)
+    dxs, dys = ray_directions(num_rays)
+    yield from ray_cast_batch(x, y, dxs, dys, maze)
@@ -12,14 +12,24 @@ class TTSThread(threading.Thread):
         if engine is None:
             self.engine = pyttsx3.init()
 
-        self._in_queue = queue.Queue()
+        # the queue is bounded so that a burst of say() calls can't build up an ever-growing speech backlog
+        self._in_queue = queue.Queue(maxsize=4)
         self._terminate_event = threading.Event()
 
     def terminate(self):
         self._terminate_event.set()
 
     def say(self, text):
-        self._in_queue.put(text)
+        """Queue text to be spoken
+
+        If the queue is full, the text is dropped - stale announcements are worse than missing ones.
+
+        :param text: Text to speak
+        """
+        try:
+            self._in_queue.put_nowait(text)
+        except queue.Full:
+            pass
 
     def run(self):
         while not self._terminate_event.is_set():
@@ -28,7 +38,14 @@ class TTSThread(threading.Thread):
             except queue.Empty:
                 continue
 
+            # say everything that has been queued in one go, to amortise the engine start-up latency
             self.engine.say(text)
+            while True:
+                try:
+                    self.engine.say(self._in_queue.get_nowait())
+                except queue.Empty:
+                    break
+
             self.engine.runAndWait()
 
 
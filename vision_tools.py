@@ -1,12 +1,14 @@
-from math import atan2, pi
-from typing import Tuple, Literal, Union, Generator
+from functools import partial
+from math import atan2, exp2, floor, hypot, pi
+from typing import Tuple, Literal, Union
 import numpy as np
 import pyglet
 from pyglet.window import key, mouse
 
 from drawing import Scene
 from game import Game
-from ray_casting import ray_casts, ray_cast
+from maze import WALL_MASKS
+from ray_casting import ray_cast, ray_cast_batch, ray_directions
 from tts import TTSThread
 
 
@@ -19,9 +21,17 @@ class VisionTool:
     This class keeps track of the keyboard state, the mouse button state, the mouse position, and the direction that the
     mouse is moving.
 
+    Subclasses react to keys by putting zero-argument callables into _key_press_handlers and _key_release_handlers,
+    keyed by key symbol. A key press is then a single dict lookup rather than a chain of range tests.
+
     :param game: Game that is being navigated
     :param scene: Scene that is being used to view the game. This is needed if the player rotates their perspective.
     """
+    # the tools are all fixed sets of attributes read in tight per-frame loops, so they declare __slots__ -
+    # attribute access becomes a C-level descriptor read instead of a dict lookup
+    __slots__ = ('game', 'scene', '_key_state', '_mouse_state', '_mouse_position', '_mouse_direction',
+                 '_key_press_handlers', '_key_release_handlers')
+
     def __init__(self, game: Game, scene: Scene):
         self.game = game
         self.scene = scene
@@ -29,6 +39,8 @@ class VisionTool:
         self._mouse_state = mouse.MouseStateHandler()
         self._mouse_position = np.zeros(2, dtype=np.float64)
         self._mouse_direction = np.zeros(2, dtype=np.float64)
+        self._key_press_handlers = {}
+        self._key_release_handlers = {}
 
     def update(self, dt):
         pass
@@ -36,9 +48,17 @@ class VisionTool:
     def on_key_press(self, symbol, modifiers):
         self._key_state.on_key_press(symbol, modifiers)
 
+        handler = self._key_press_handlers.get(symbol)
+        if handler is not None:
+            handler()
+
     def on_key_release(self, symbol, modifiers):
         self._key_state.on_key_release(symbol, modifiers)
 
+        handler = self._key_release_handlers.get(symbol)
+        if handler is not None:
+            handler()
+
     def on_mouse_motion(self, x, y, dx, dy):
         self._mouse_position[:] = x, y
         self._mouse_direction[:] = dx, dy
@@ -57,6 +77,35 @@ class VisionTool:
         self._mouse_state.on_mouse_release(x, y, button, modifiers)
 
 
+# The TTS thread shared by every tool that speaks. A pyttsx3 engine is expensive to start and there is no point
+# running more than one, so it is created lazily and reused.
+_tts_thread = None
+
+
+def _shared_tts_thread() -> TTSThread:
+    global _tts_thread
+    if _tts_thread is None:
+        _tts_thread = TTSThread()
+        _tts_thread.setDaemon(True)
+        _tts_thread.start()
+
+    return _tts_thread
+
+
+# Chord frequencies cached by chord shape, so rebuilding a tool with the same shape skips the power chain. The Sine
+# sources themselves can't be shared, because pyglet streaming sources can only be queued on one player at a time.
+_chord_frequencies = {}
+
+
+def _chord(chord_shape: Tuple[int, ...]) -> Tuple[float, ...]:
+    chord = _chord_frequencies.get(chord_shape)
+    if chord is None:
+        chord = _chord_frequencies[chord_shape] = tuple(440.0 * exp2(num_steps / 12.0)
+                                                        for num_steps in chord_shape)
+
+    return chord
+
+
 class ChordVisionTool(VisionTool):
     """Navigation using a chord
 
@@ -73,11 +122,12 @@ class ChordVisionTool(VisionTool):
                         above middle A. The notes are played from the front, left, behind, and right in that order. The
                         default is A Major 7.
     """
+    __slots__ = ('player_group', '_points', '_note_positions')
+
     def __init__(self, game: Game, scene: Scene, chord_shape: Tuple[int, int, int, int] = (0, 4, 7, 11)):
         super().__init__(game, scene)
 
-        twelfth_root_of_2 = 2 ** (1 / 12)
-        chord = [440 * twelfth_root_of_2 ** num_steps for num_steps in chord_shape]
+        chord = _chord(chord_shape)
 
         self.player_group = pyglet.media.PlayerGroup([pyglet.media.Player() for _ in range(4)])
         for player, note in zip(self.player_group.players, chord):
@@ -87,37 +137,49 @@ class ChordVisionTool(VisionTool):
 
         self.player_group.play()
 
-    def on_key_press(self, symbol, modifiers):
-        super().on_key_press(symbol, modifiers)
-
-        # turn off notes
-        if key._1 <= symbol <= key._4:
-            self.player_group.players[symbol - key._1].pause()
+        # reused by update() every frame, so the ray casts don't allocate
+        self._points = np.empty((len(self.player_group.players), 2), dtype=np.float64)
 
-    def on_key_release(self, symbol, modifiers):
-        super().on_key_release(symbol, modifiers)
+        # last position pushed to each player - assigning player.position goes into the audio driver, so it is
+        # skipped while the player stands still and the positions don't change
+        self._note_positions = [None] * len(self.player_group.players)
 
-        # turn notes back on
-        if key._1 <= symbol <= key._4:
-            self.player_group.players[symbol - key._1].play()
+        # keys 1-4 turn the notes off while held
+        for i, player in enumerate(self.player_group.players):
+            self._key_press_handlers[key._1 + i] = player.pause
+            self._key_release_handlers[key._1 + i] = player.play
 
     def update(self, dt):
-        # find the positions that the notes should be played from using ray casts
-        points = ray_casts(*self.game.player.position(), self.game.maze, num_rays=len(self.player_group.players))
-        points = np.array(list(points))
+        # find the positions that the notes should be played from using ray casts, written into the reusable buffer
+        points = self._points
+        dxs, dys = ray_directions(len(points))
+        x, y, center_x, center_y = self.game.player.snapshot()
+        ray_cast_batch(x, y, dxs, dys, self.game.maze, out=points)
 
         # change origin to the player, and scale up
-        points -= self.game.player.center()
+        points -= center_x, center_y
         points *= 5
 
-        # change positions of sounds
-        for player, (x, y) in zip(self.player_group.players, points):
-            x, y = self.scene.rotate_vector(x, y)
-            player.position = x, 0.0, y
+        # change positions of sounds. When the scene isn't rotated the rotation is the identity, so skip it; when it
+        # is, apply the 2x2 rotation inline with the cached sin and cos instead of calling rotate_vector per note.
+        note_positions = self._note_positions
+        if not self.scene.is_rotated:
+            for i, (player, (x, y)) in enumerate(zip(self.player_group.players, points.tolist())):
+                position = x, 0.0, y
+                if position != note_positions[i]:
+                    player.position = note_positions[i] = position
+        else:
+            c, s = self.scene._cos_rotation, self.scene._sin_rotation
+            for i, (player, (x, y)) in enumerate(zip(self.player_group.players, points.tolist())):
+                position = c * x + s * y, 0.0, -s * x + c * y
+                if position != note_positions[i]:
+                    player.position = note_positions[i] = position
 
 
 class ChordVisionToolWithBeeps(ChordVisionTool):
     """Beeping noises are used, and the beep frequency is higher for walls that are further away"""
+    __slots__ = ('phases', '_beeping')
+
     def __init__(self, game, scene, chord_shape=(0, 4, 7, 11)):
         super().__init__(game, scene, chord_shape=chord_shape)
 
@@ -127,21 +189,29 @@ class ChordVisionToolWithBeeps(ChordVisionTool):
 
         self.phases = [0.0] * len(self.player_group.players)
 
-    def update(self, dt):
-        # find the positions that the notes should be played from using ray casts
-        points = ray_casts(*self.game.player.position(), self.game.maze, num_rays=len(self.player_group.players))
-        points = np.array(list(points))
-
-        # change origin to the player, and scale up
-        points -= self.game.player.center()
+        # whether each player is currently beeping, so play()/pause() are only called when the state flips
+        self._beeping = [False] * len(self.player_group.players)
 
-        for i, (point, player) in enumerate(zip(points, self.player_group.players)):
-            modulation_frequency = np.sum(point) * 2.0
+    def update(self, dt):
+        # find the positions that the notes should be played from using ray casts, written into the reusable buffer
+        points = self._points
+        dxs, dys = ray_directions(len(points))
+        x, y, center_x, center_y = self.game.player.snapshot()
+        ray_cast_batch(x, y, dxs, dys, self.game.maze, out=points)
+
+        # plain float maths - numpy dispatch on 2-element arrays costs more than the additions themselves
+        for i, ((point_x, point_y), player) in enumerate(zip(points.tolist(), self.player_group.players)):
+            modulation_frequency = (point_x - center_x + point_y - center_y) * 2.0
             self.phases[i] = (self.phases[i] + dt * modulation_frequency) % 1.0
-            if self.phases[i] < 0.5:
-                player.play()
-            else:
-                player.pause()
+
+            # the audio backend is sensitive to play/pause churn, so only call when the beep state actually flips
+            beeping = self.phases[i] < 0.5
+            if beeping != self._beeping[i]:
+                if beeping:
+                    player.play()
+                else:
+                    player.pause()
+                self._beeping[i] = beeping
 
 
 class SingleRayCastTool(VisionTool):
@@ -150,6 +220,8 @@ class SingleRayCastTool(VisionTool):
 
     Higher volume = closer.
     """
+    __slots__ = ('player',)
+
     def __init__(self, game, scene):
         super().__init__(game, scene)
 
@@ -165,16 +237,16 @@ class SingleRayCastTool(VisionTool):
             self.player.pause()
 
     def update(self, dt):
-        if np.all(self._mouse_direction == 0):
+        direction_x, direction_y = self._mouse_direction
+        if direction_x == 0.0 and direction_y == 0.0:
             return
 
-        vector = self._mouse_direction.copy()
-        vector /= np.linalg.norm(vector)
-        vector[1] *= -1
-        point = ray_cast(*self.game.player.center(), *vector, self.game.maze)
-        point -= self.game.player.center()
-        point *= 5.0
-        self.player.position = point[0], 0.0, point[1]
+        # normalise with math.hypot - np.linalg.norm on a 2-vector is mostly dispatch overhead
+        inverse_norm = 1.0 / hypot(direction_x, direction_y)
+        center_x, center_y = self.game.player.center()
+        point_x, point_y = ray_cast(center_x, center_y, direction_x * inverse_norm, -direction_y * inverse_norm,
+                                    self.game.maze)
+        self.player.position = (point_x - center_x) * 5.0, 0.0, (point_y - center_y) * 5.0
 
 
 class HallwayCheckTool(VisionTool):
@@ -186,6 +258,12 @@ class HallwayCheckTool(VisionTool):
     If there are no walls either side of it, both sounds will be played. It will move along the hall until it hits the
     wall at the end.
     """
+    __slots__ = ('anticlockwise_sound', 'clockwise_sound', 'null_sound', 'stop_sound', '_player', '_drone')
+
+    # unit velocity and the WALL_MASKS indices of the anticlockwise and clockwise walls for each direction, so
+    # starting and stepping the drone is a table lookup instead of branches and modulo arithmetic
+    _DIR_TABLE = ((-1.0, 0.0, 3, 1), (0.0, -1.0, 0, 2), (1.0, 0.0, 1, 3), (0.0, 1.0, 2, 0))
+
     def __init__(self, game, scene):
         super().__init__(game, scene)
 
@@ -196,85 +274,82 @@ class HallwayCheckTool(VisionTool):
 
         self._player = pyglet.media.Player()
 
-        self._coroutine_running = None
-
-    def start_hallway_check(self, direction: Union[Literal['left', 'up', 'right', 'down'], int], cells_per_second=2.0):
-        if self._coroutine_running is not None:
-            self._coroutine_running.close()
-
-        self._coroutine_running = self.hallway_check_coroutine(direction, cells_per_second=cells_per_second)
+        # state of the drone while it is moving, or None - see start_hallway_check()
+        self._drone = None
 
-        try:
-            next(self._coroutine_running)
-        except StopIteration:
-            pass
+        for direction, symbol in enumerate((key.LEFT, key.UP, key.RIGHT, key.DOWN)):
+            self._key_press_handlers[symbol] = partial(self.start_hallway_check, direction)
 
-    def hallway_check_coroutine(self, direction: Union[Literal['left', 'up', 'right', 'down'], int],
-                                cells_per_second=2.0) -> Generator[None, float, None]:
-        """A coroutine used to effect a drone moving along a corridor
+    def start_hallway_check(self, direction: Union[Literal['left', 'up', 'right', 'down'], int], cells_per_second=2.0):
+        """Send a drone along a hallway
 
-        Send this coroutine the delta time since the last send. It will play the sounds described in the class
-        docstring.
+        The drone is stepped by update() and plays the sounds described in the class docstring.
 
         :param direction: Direction that the drone moves. This can be a string, or a number between 0 and 3. 0 is left,
                           and subsequent numbers move anticlockwise.
         :param cells_per_second: Speed of the drone in cells per second.
-        :return:
         """
         if type(direction) is str:
             direction = ['left', 'up', 'right', 'down'].index(direction)
 
-        velocity = np.zeros(2, dtype=np.float64)
-        if direction % 2 == 0:
-            velocity[0] = direction - 1
-        else:
-            velocity[1] = direction - 2
-        velocity *= cells_per_second
-
-        position = np.floor([self.game.player.x, self.game.player.y], dtype=np.float64)
+        # the drone state is kept as plain floats - stepping a 2-element ndarray every frame costs more than the
+        # couple of multiplications it saves
+        velocity_x, velocity_y, anticlockwise_index, clockwise_index = self._DIR_TABLE[direction]
 
-        current_cell = self.game.maze.cell_at(*position.astype(np.int32))
-        while not current_cell.walls[direction]:
-            dt = (yield)
-            position += velocity * dt
+        x, y = float(floor(self.game.player.x)), float(floor(self.game.player.y))
 
-            next_cell = self.game.maze.cell_at(*position.astype(np.int32))
-            if next_cell == current_cell:
-                continue
+        self._drone = {
+            'direction': direction,
+            'velocity_x': velocity_x * cells_per_second,
+            'velocity_y': velocity_y * cells_per_second,
+            'anticlockwise_index': anticlockwise_index,
+            'clockwise_index': clockwise_index,
+            'x': x,
+            'y': y,
+            'cell': (int(x), int(y)),
+        }
 
-            anti_clockwise_wall = next_cell.walls[(direction - 1) % 4]
-            clockwise_wall = next_cell.walls[(direction + 1) % 4]
-            if not anti_clockwise_wall:
-                self._player.queue(self.anticlockwise_sound)
-            if not clockwise_wall:
-                self._player.queue(self.clockwise_sound)
-            if anti_clockwise_wall and clockwise_wall:
-                self._player.queue(self.null_sound)
+        self._stop_drone_at_wall()
 
-            self._player.play()
+    def _stop_drone_at_wall(self):
+        # if the drone's cell has a wall in its direction of travel, queue the stop sound and discard the drone
+        x, y = self._drone['cell']
+        if self.game.maze.wall_bits(x, y) & WALL_MASKS[self._drone['direction']]:
+            self._player.queue(self.stop_sound)
+            self._drone = None
 
-            current_cell = next_cell
+    def update(self, dt):
+        if self._drone is None:
+            return
 
-        self._player.queue(self.stop_sound)
+        drone = self._drone
+        drone['x'] += drone['velocity_x'] * dt
+        drone['y'] += drone['velocity_y'] * dt
 
-    def on_key_press(self, symbol, modifiers):
-        super().on_key_press(symbol, modifiers)
+        next_cell = (int(drone['x']), int(drone['y']))
+        if next_cell == drone['cell']:
+            return
 
-        if key.LEFT <= symbol <= key.DOWN:
-            self.start_hallway_check(symbol - key.LEFT)
+        self._drone['cell'] = next_cell
+        wall_bits = self.game.maze.wall_bits(*next_cell)
+        anti_clockwise_wall = wall_bits & WALL_MASKS[drone['anticlockwise_index']]
+        clockwise_wall = wall_bits & WALL_MASKS[drone['clockwise_index']]
+        if not anti_clockwise_wall:
+            self._player.queue(self.anticlockwise_sound)
+        if not clockwise_wall:
+            self._player.queue(self.clockwise_sound)
+        if anti_clockwise_wall and clockwise_wall:
+            self._player.queue(self.null_sound)
 
-    def update(self, dt):
-        if self._coroutine_running is None:
-            return
+        self._player.play()
 
-        try:
-            self._coroutine_running.send(dt)
-        except StopIteration:
-            self._coroutine_running = None
+        self._stop_drone_at_wall()
 
 
 class FootstepsTool(VisionTool):
     """Play a footstep sound while the player is moving"""
+    __slots__ = ('player', '_last_position', '_is_playing')
+
     def __init__(self, game, scene):
         super().__init__(game, scene)
 
@@ -285,14 +360,21 @@ class FootstepsTool(VisionTool):
         self.player.queue(sound)
 
         self._last_position = self.game.player.position()
+        self._is_playing = False
 
     def update(self, dt):
-        if np.any(self._last_position != self.game.player.position()):
-            self.player.play()
-        else:
-            self.player.pause()
+        position = self.game.player.position()
+        moving = position != self._last_position
 
-        self._last_position = self.game.player.position()
+        # only touch the player when the moving state flips - play()/pause() aren't free no-ops in pyglet
+        if moving != self._is_playing:
+            if moving:
+                self.player.play()
+            else:
+                self.player.pause()
+            self._is_playing = moving
+
+        self._last_position = position
 
 
 class ChangingCellNotificationTool(VisionTool):
@@ -302,6 +384,8 @@ class ChangingCellNotificationTool(VisionTool):
     whoosh sound is played. If the player is moving diagonally, then having different sounds helps tells the player if
     they are moving against a wall.
     """
+    __slots__ = ('horizontal_sound', 'vertical_sound', 'player', '_last_cell')
+
     def __init__(self, game, scene):
         super().__init__(game, scene)
 
@@ -311,8 +395,8 @@ class ChangingCellNotificationTool(VisionTool):
 
         self._last_cell = self.game.current_cell()
 
-    def update(self, dt):
-        next_cell = self.game.current_cell()
+    def update(self, dt, cell=None):
+        next_cell = self.game.current_cell() if cell is None else cell
         if next_cell == self._last_cell:
             return
 
@@ -332,6 +416,8 @@ class SurroundCheckTool(VisionTool):
     It checks to the left, then top, then right, them bottom of the player. If there is a wall there, it makes a click
     sound. Else, it makes a bell sound. Press space to do the check.
     """
+    __slots__ = ('no_wall_sound', 'wall_sound', 'player')
+
     def __init__(self, game, scene):
         super().__init__(game, scene)
 
@@ -340,18 +426,20 @@ class SurroundCheckTool(VisionTool):
 
         self.player = pyglet.media.Player()
 
-    def on_key_press(self, symbol, modifiers):
-        super().on_key_press(symbol, modifiers)
+        self._key_press_handlers[key.SPACE] = self._check_surroundings
 
-        if symbol != key.SPACE:
-            return
-
-        while self.player.source is not None:
-            self.player.next_source()
+    def _check_surroundings(self):
+        # a previous check may still be part-way through its queue. Stepping next_source() until it drains is a
+        # variable number of pyglet dispatches, so just drop the player and start with a fresh one.
+        if self.player.source is not None:
+            self.player.pause()
+            self.player.delete()
+            self.player = pyglet.media.Player()
 
-        cell = self.game.current_cell()
-        for wall_present in cell.walls:
-            self.player.queue(self.wall_sound if wall_present else self.no_wall_sound)
+        center_x, center_y = self.game.player.center()
+        wall_bits = self.game.maze.wall_bits(int(center_x), int(center_y))
+        for mask in WALL_MASKS:
+            self.player.queue(self.wall_sound if wall_bits & mask else self.no_wall_sound)
 
         self.player.play()
 
@@ -362,38 +450,46 @@ class BreadcrumbTool(VisionTool):
     Press E to place a marker. It will say a number that will be associated with that marker. Whenever the player
     returns to that marker, it will say that number again.
     """
+    __slots__ = ('tts_thread', 'breadcrumbs', '_last_cell_id')
+
     def __init__(self, game, scene):
         super().__init__(game, scene)
 
-        self.tts_thread = TTSThread()
-        self.tts_thread.setDaemon(True)
-        self.tts_thread.start()
+        self.tts_thread = _shared_tts_thread()
 
+        # breadcrumb numbers keyed by flat cell index (y * width + x) - hashing a small int is cheaper than hashing
+        # a Cell, and it avoids building a Cell at all
         self.breadcrumbs = {}
 
-        self._last_cell = self.game.current_cell()
+        self._last_cell_id = self._current_cell_id()
 
-    def on_key_press(self, symbol, modifiers):
-        if symbol != key.E:
-            return
+        self._key_press_handlers[key.E] = self._place_breadcrumb
 
-        cell = self.game.current_cell()
-        if cell not in self.breadcrumbs:
-            self.breadcrumbs[cell] = len(self.breadcrumbs)
+    def _current_cell_id(self):
+        center_x, center_y = self.game.player.center()
+        return int(center_y) * self.game.maze.width + int(center_x)
+
+    def _place_breadcrumb(self):
+        cell_id = self._current_cell_id()
+        if cell_id not in self.breadcrumbs:
+            self.breadcrumbs[cell_id] = len(self.breadcrumbs)
             self.tts_thread.say(str(len(self.breadcrumbs) - 1))
         else:
-            self.tts_thread.say(str(self.breadcrumbs[cell]))
+            self.tts_thread.say(str(self.breadcrumbs[cell_id]))
 
-    def update(self, dt):
-        next_cell = self.game.current_cell()
-        if next_cell == self._last_cell:
+    def update(self, dt, cell=None):
+        if cell is None:
+            next_cell_id = self._current_cell_id()
+        else:
+            next_cell_id = cell.y * self.game.maze.width + cell.x
+        if next_cell_id == self._last_cell_id:
             return
 
-        if next_cell in self.breadcrumbs:
-            breadcrumb_number = self.breadcrumbs[next_cell]
+        if next_cell_id in self.breadcrumbs:
+            breadcrumb_number = self.breadcrumbs[next_cell_id]
             self.tts_thread.say(str(breadcrumb_number))
 
-        self._last_cell = next_cell
+        self._last_cell_id = next_cell_id
 
 
 class CombinedTool(VisionTool):
@@ -402,6 +498,8 @@ class CombinedTool(VisionTool):
     Instead of using arrow keys for the HallwayCheckTool, you can send the drone by moving the mouse, and pressing and
     releasing the right mouse button.
     """
+    __slots__ = ('hallway_check_tool', 'cell_change_tool', 'surround_check_tool', 'breadcrumb_tool')
+
     def __init__(self, game, scene):
         super().__init__(game, scene)
 
@@ -410,10 +508,10 @@ class CombinedTool(VisionTool):
         self.surround_check_tool = SurroundCheckTool(game, scene)
         self.breadcrumb_tool = BreadcrumbTool(game, scene)
 
-    def on_key_press(self, symbol, modifiers):
-        super().on_key_press(symbol, modifiers)
-        self.surround_check_tool.on_key_press(symbol, modifiers)
-        self.breadcrumb_tool.on_key_press(symbol, modifiers)
+        # merge the sub-tools' key handlers, so a key press is one dict lookup instead of a chain of handlers. The
+        # hallway check tool is deliberately left out - its drone is sent with the mouse here, not the arrow keys.
+        self._key_press_handlers.update(self.surround_check_tool._key_press_handlers)
+        self._key_press_handlers.update(self.breadcrumb_tool._key_press_handlers)
 
     def on_mouse_release(self, x, y, button, modifiers):
         if button == mouse.RIGHT:
@@ -425,6 +523,9 @@ class CombinedTool(VisionTool):
 
     def update(self, dt):
         super().update(dt)
+
+        # both cell-based sub-tools need the player's cell, so look it up once and hand it to them
+        cell = self.game.current_cell()
         self.hallway_check_tool.update(dt)
-        self.cell_change_tool.update(dt)
-        self.breadcrumb_tool.update(dt)
+        self.cell_change_tool.update(dt, cell=cell)
+        self.breadcrumb_tool.update(dt, cell=cell)